@@ -1,11 +1,19 @@
 # Standard library
+import io
+import queue
+import re
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # Third-party
-import mlflow
-import mlflow.pytorch
 import pytorch_lightning as pl
+from botocore.exceptions import NoCredentialsError
 from loguru import logger
+from mlflow.entities import Metric, Param, RunTag
+from PIL import Image
+from pytorch_lightning.utilities import rank_zero_only
 
 
 class CustomMLFlowLogger(pl.loggers.MLFlowLogger):
@@ -15,14 +23,197 @@ class CustomMLFlowLogger(pl.loggers.MLFlowLogger):
     of version `2.0.3` at least.
     """
 
+    # maximum number of metrics MLFlow accepts in a single `log_batch` call
+    MAX_METRICS_PER_BATCH = 1000
+    # maximum time (in seconds) metrics are queued before being sent
+    METRICS_FLUSH_INTERVAL = 10.0
+
     def __init__(self, experiment_name, tracking_uri, run_name):
         super().__init__(
             experiment_name=experiment_name, tracking_uri=tracking_uri
         )
 
-        mlflow.start_run(run_id=self.run_id, log_system_metrics=True)
-        mlflow.set_tag("mlflow.runName", run_name)
-        mlflow.log_param("run_id", self.run_id)
+        # set the run name and log the run id with a single request
+        self.experiment.log_batch(
+            run_id=self.run_id,
+            params=[Param(key="run_id", value=self.run_id)],
+            tags=[RunTag(key="mlflow.runName", value=run_name)],
+        )
+
+        # log system metrics (CPU, GPU, memory etc) for the run, this is what
+        # `mlflow.start_run(..., log_system_metrics=True)` does but without
+        # making the run the globally active run of the fluent API
+        self._system_metrics_monitor = None
+        self._start_system_metrics_monitor()
+
+        # metrics are put on a queue and sent by a background thread, so that
+        # training doesn't wait for requests to the tracking server. The
+        # queue, events and thread are created on first use (see
+        # `_start_metrics_thread`) since they can't be pickled
+        self._metrics_queue = None
+        self._metrics_flush = None
+        self._metrics_stop = None
+        self._metrics_thread = None
+
+        # images are uploaded in background threads so that training doesn't
+        # wait for the upload to complete, the executor is likewise created
+        # on first use
+        self._image_executor = None
+        self._image_futures = []
+
+    def _start_system_metrics_monitor(self):
+        """
+        Start logging system metrics for the run. The monitor class isn't
+        part of MLFlow's public API, so if it can't be imported (or fails to
+        start) system metrics are simply not logged.
+        """
+        try:
+            # Third-party
+            from mlflow.system_metrics.system_metrics_monitor import (
+                SystemMetricsMonitor,
+            )
+        except ImportError as ex:
+            logger.warning(
+                "System metrics logging isn't available with the installed "
+                f"version of MLFlow: {ex}"
+            )
+            return
+
+        try:
+            self._system_metrics_monitor = SystemMetricsMonitor(
+                run_id=self.run_id
+            )
+            self._system_metrics_monitor.start()
+        except Exception as ex:
+            self._system_metrics_monitor = None
+            logger.warning(f"Failed to start logging system metrics: {ex}")
+
+    def __getstate__(self):
+        # The metrics queue and thread, the image upload executor and the
+        # system metrics monitor can't be pickled (e.g. when the logger is
+        # sent to processes started with `ddp_spawn`), these are left out
+        # and the queue, thread and executor are created again on first use
+        state = self.__dict__.copy()
+        state.update(
+            _metrics_queue=None,
+            _metrics_flush=None,
+            _metrics_stop=None,
+            _metrics_thread=None,
+            _image_executor=None,
+            _image_futures=[],
+            _system_metrics_monitor=None,
+        )
+        return state
+
+    def _start_metrics_thread(self):
+        """
+        Start the background thread sending the queued metrics (see
+        `_send_queued_metrics_loop`), creating the queue the first time.
+        """
+        if self._metrics_queue is None:
+            self._metrics_queue = queue.Queue()
+            self._metrics_flush = threading.Event()
+            self._metrics_stop = threading.Event()
+        self._metrics_stop.clear()
+        self._metrics_thread = threading.Thread(
+            target=self._send_queued_metrics_loop,
+            name="mlflow-log-metrics",
+            daemon=True,
+        )
+        self._metrics_thread.start()
+
+    @rank_zero_only
+    def log_metrics(self, metrics, step=None):
+        """
+        Log metrics to MLFlow. Rather than making one request per call the
+        metrics are queued and sent by a background thread with a single
+        `log_batch` request every `METRICS_FLUSH_INTERVAL` seconds, as soon
+        as `MAX_METRICS_PER_BATCH` metrics have been queued and when the
+        logger is finalized.
+
+        metrics: dict
+            Dictionary of metric names and values to log
+        step: Union[int, None]
+            Step to log the metrics under, defaults to 0 if None
+        """
+        if self._metrics_thread is None or not self._metrics_thread.is_alive():
+            self._start_metrics_thread()
+
+        timestamp_ms = int(time.time() * 1000)
+        for key, value in metrics.items():
+            if isinstance(value, str):
+                logger.warning(
+                    f"Discarding metric with string value {key}={value}."
+                )
+                continue
+            # MLFlow only allows '_', '/', '.', ' ' and '-' special characters
+            # in metric names
+            key = re.sub("[^a-zA-Z0-9_/. -]+", "", key)
+            self._metrics_queue.put(
+                Metric(
+                    key=key,
+                    value=float(value),
+                    timestamp=timestamp_ms,
+                    step=step or 0,
+                )
+            )
+
+        if self._metrics_queue.qsize() >= self.MAX_METRICS_PER_BATCH:
+            self._metrics_flush.set()
+
+    def _send_queued_metrics_loop(self):
+        """
+        Send queued metrics to MLFlow until the logger is finalized, run in a
+        background thread.
+        """
+        while not self._metrics_stop.is_set():
+            self._metrics_flush.wait(timeout=self.METRICS_FLUSH_INTERVAL)
+            self._metrics_flush.clear()
+            self._send_queued_metrics()
+        # send what was queued while sending the last batch
+        self._send_queued_metrics()
+
+    def _send_queued_metrics(self):
+        """
+        Send all queued metrics to MLFlow, in batches of at most
+        `MAX_METRICS_PER_BATCH` metrics.
+        """
+        while not self._metrics_queue.empty():
+            batch = []
+            while len(batch) < self.MAX_METRICS_PER_BATCH:
+                try:
+                    batch.append(self._metrics_queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.experiment.log_batch(run_id=self.run_id, metrics=batch)
+            except Exception as ex:
+                logger.error(
+                    f"Error logging {len(batch)} metrics to MLFlow: {ex}"
+                )
+
+    @rank_zero_only
+    def finalize(self, status="success"):
+        """
+        Send any queued metrics and wait for image uploads to complete before
+        finalizing the run.
+
+        status: str
+            Status of the run, passed on to the pytorch-lightning logger
+        """
+        if self._metrics_thread is not None:
+            self._metrics_stop.set()
+            self._metrics_flush.set()
+            self._metrics_thread.join()
+            self._metrics_thread = None
+        self._check_image_uploads(wait=True)
+        if self._image_executor is not None:
+            self._image_executor.shutdown(wait=True)
+            self._image_executor = None
+        if self._system_metrics_monitor is not None:
+            self._system_metrics_monitor.finish()
+            self._system_metrics_monitor = None
+        super().finalize(status)
 
     @property
     def save_dir(self):
@@ -48,21 +239,48 @@ class CustomMLFlowLogger(pl.loggers.MLFlowLogger):
         step: Union[int, None]
             Step to log the image under. If None, logs under the key directly
         """
-        # Third-party
-        from botocore.exceptions import NoCredentialsError
-        from PIL import Image
-
         if step is not None:
             key = f"{key}_{step}"
 
-        # Need to save the image to a temporary file, then log that file
-        # mlflow.log_image, should do this automatically, but is buggy
-        temporary_image = f"{key}.png"
-        images[0].savefig(temporary_image)
+        # Render the figure to an in-memory PNG (mlflow.log_image should be
+        # able to take the figure directly, but is buggy). This has to happen
+        # here since matplotlib isn't thread-safe and the figure may be closed
+        # once this method returns
+        buffer = io.BytesIO()
+        images[0].savefig(buffer, format="png")
+        buffer.seek(0)
+        img = Image.open(buffer)
 
-        img = Image.open(temporary_image)
-        try:
-            mlflow.log_image(img, f"{key}.png")
-        except NoCredentialsError:
-            logger.error("Error logging image\nSet AWS credentials")
-            sys.exit(1)
+        # Check for failures of earlier uploads before starting a new one.
+        # The client API is used since the active run of the fluent API is
+        # local to the thread that started it
+        self._check_image_uploads()
+        if self._image_executor is None:
+            self._image_executor = ThreadPoolExecutor(
+                max_workers=2, thread_name_prefix="mlflow-log-image"
+            )
+        self._image_futures.append(
+            self._image_executor.submit(
+                self.experiment.log_image, self.run_id, img, f"{key}.png"
+            )
+        )
+
+    def _check_image_uploads(self, wait=False):
+        """
+        Check the background image uploads for errors, exiting if AWS
+        credentials are missing, and remove the completed uploads.
+
+        wait: bool
+            Whether to wait for all uploads to complete
+        """
+        pending = []
+        for future in self._image_futures:
+            if not (wait or future.done()):
+                pending.append(future)
+                continue
+            try:
+                future.result()
+            except NoCredentialsError:
+                logger.error("Error logging image\nSet AWS credentials")
+                sys.exit(1)
+        self._image_futures = pending
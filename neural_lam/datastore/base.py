@@ -5,11 +5,12 @@ import dataclasses
 import functools
 from functools import cached_property
 from pathlib import Path
-from typing import List, Union
+from typing import List, Tuple, Union
 
 # Third-party
 import cartopy.crs as ccrs
 import numpy as np
+import pandas as pd
 import xarray as xr
 from pandas.core.indexes.multi import MultiIndex
 
@@ -258,6 +259,36 @@ class BaseDatastore(abc.ABC):
         """
         pass
 
+    def get_time_chunk_sizes(
+        self, category: str, split: str
+    ) -> Union[Tuple[int, ...], None]:
+        """
+        Return the sizes of the chunks that the data of the given category and
+        split is stored in along its first time dimension (`time`, or
+        `analysis_time` if `is_forecast` is True), counted from the first time
+        step returned by `get_dataarray`. These are the blocks of time steps
+        that are read together from storage, which can be used to group reads
+        of the same stored chunks (see `weather_dataset.ChunkAwareSampler`).
+
+        The default implementation returns `None`, meaning that the data isn't
+        stored in chunks along time (or that these aren't known).
+
+        Parameters
+        ----------
+        category : str
+            The category of the dataset (state/forcing).
+        split : str
+            The time split to filter the dataset (train/val/test).
+
+        Returns
+        -------
+        Tuple[int, ...] or None
+            The sizes of the stored chunks along the first time dimension,
+            summing to the number of time steps of the split.
+
+        """
+        return None
+
     @cached_property
     @abc.abstractmethod
     def boundary_mask(self) -> xr.DataArray:
@@ -497,6 +528,51 @@ class BaseRegularGridDatastore(BaseDatastore):
         """
         pass
 
+    def _set_grid_index(
+        self, da_or_ds: Union[xr.DataArray, xr.Dataset]
+    ) -> tuple:
+        """
+        Set a multi-index on `grid_index` from the `CARTESIAN_COORDS`
+        coordinates. When the grid points are stored as the full product of
+        the unique coordinate values in `CARTESIAN_COORDS` order (as is the
+        case for regular grids) the multi-index is built directly with
+        `pd.MultiIndex.from_product`, which avoids factorizing every
+        coordinate value, otherwise `set_index` is used.
+
+        Parameters
+        ----------
+        da_or_ds : xr.DataArray or xr.Dataset
+            The dataarray or dataset to set the grid index on.
+
+        Returns
+        -------
+        tuple
+            The dataarray or dataset with the multi-index set and a dict of the
+            attributes of the coordinates that were replaced by the index (and
+            should be restored after unstacking).
+        """
+        c0, c1 = (da_or_ds[c].values for c in self.CARTESIAN_COORDS)
+        u0, u1 = np.unique(c0), np.unique(c1)
+        is_product = (
+            c0.ndim == c1.ndim == 1
+            and c0.size == u0.size * u1.size
+            and np.array_equal(c0, np.repeat(u0, u1.size))
+            and np.array_equal(c1, np.tile(u1, u0.size))
+        )
+        if not is_product:
+            return da_or_ds.set_index(grid_index=self.CARTESIAN_COORDS), {}
+
+        coord_attrs = {
+            c: dict(da_or_ds[c].attrs) for c in self.CARTESIAN_COORDS
+        }
+        grid_index = pd.MultiIndex.from_product(
+            [u0, u1], names=self.CARTESIAN_COORDS
+        )
+        da_or_ds = da_or_ds.drop_vars(self.CARTESIAN_COORDS).assign_coords(
+            xr.Coordinates.from_pandas_multiindex(grid_index, "grid_index")
+        )
+        return da_or_ds, coord_attrs
+
     def unstack_grid_coords(
         self, da_or_ds: Union[xr.DataArray, xr.Dataset]
     ) -> Union[xr.DataArray, xr.Dataset]:
@@ -520,10 +596,13 @@ class BaseRegularGridDatastore(BaseDatastore):
             return da_or_ds
 
         # Check whether `grid_index` is a multi-index
+        coord_attrs = {}
         if not isinstance(da_or_ds.indexes.get("grid_index"), MultiIndex):
-            da_or_ds = da_or_ds.set_index(grid_index=self.CARTESIAN_COORDS)
+            da_or_ds, coord_attrs = self._set_grid_index(da_or_ds)
 
         da_or_ds_unstacked = da_or_ds.unstack("grid_index")
+        for coord, attrs in coord_attrs.items():
+            da_or_ds_unstacked[coord].attrs.update(attrs)
 
         # Ensure that the x, y dimensions are in the correct order
         dims = da_or_ds_unstacked.dims
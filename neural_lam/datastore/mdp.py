@@ -1,22 +1,240 @@
 # Standard library
 import copy
+import functools
 import warnings
 from functools import cached_property
 from pathlib import Path
-from typing import List
+from typing import Dict, List
 
 # Third-party
 import cartopy.crs as ccrs
 import mllam_data_prep as mdp
+import numpy as np
 import xarray as xr
+import zarr
 from loguru import logger
 from numpy import ndarray
+from xarray.core import indexing
 
 # Local
 from ..utils import rank_zero_print
 from .base import BaseRegularGridDatastore, CartesianGridShape
 
 
+@functools.lru_cache(maxsize=32)
+def _load_config_cached(path: str, mtime: float, size: int) -> mdp.Config:
+    """
+    Parse the mllam-data-prep config file at `path`, memoized on the path and
+    the modification time and size of the file so that an edited config file
+    is parsed again. The returned config object is shared between calls and
+    so must not be modified, use a copy instead.
+
+    Parameters
+    ----------
+    path : str
+        The path to the config file.
+    mtime : float
+        The modification time of the config file, only used as part of the
+        cache key.
+    size : int
+        The size (in bytes) of the config file, only used as part of the cache
+        key.
+
+    Returns
+    -------
+    mdp.Config
+        The parsed configuration.
+
+    """
+    return mdp.Config.from_yaml_file(path)
+
+
+@functools.lru_cache(maxsize=64)
+def _open_zarr_group_cached(path: str, mtime: float):
+    """
+    Open the zarr archive at `path` as a read-only `zarr.Group`, memoized on
+    the path and modification time. This is much cheaper than opening the
+    archive with xarray and is used for reading small arrays (like the grid
+    coordinates) directly.
+
+    Parameters
+    ----------
+    path : str
+        The path to the zarr archive.
+    mtime : float
+        The modification time of the zarr archive, only used as part of the
+        cache key.
+
+    Returns
+    -------
+    zarr.Group
+        The opened zarr group.
+
+    """
+    try:
+        return zarr.open_consolidated(path, mode="r")
+    except (KeyError, ValueError):
+        # zarr-python v2 raises KeyError and v3 raises ValueError when the
+        # consolidated metadata is missing
+        return zarr.open_group(path, mode="r")
+
+
+class _TensorStoreBackendArray(xr.backends.BackendArray):
+    """
+    Lazily indexed array that reads the values of the indexed region from a
+    TensorStore array, used for the data of the "tensorstore" zarr backend.
+
+    Parameters
+    ----------
+    array : tensorstore.TensorStore
+        The opened TensorStore array to read from.
+
+    """
+
+    def __init__(self, array):
+        self.array = array
+        self.shape = tuple(array.shape)
+        self.dtype = np.dtype(array.dtype.numpy_dtype)
+
+    def __getitem__(self, key):
+        return indexing.explicit_indexing_adapter(
+            key,
+            self.shape,
+            indexing.IndexingSupport.OUTER,
+            self._read,
+        )
+
+    def _read(self, key):
+        return self.array.oindex[key].read().result()
+
+
+def _open_with_tensorstore(ds: xr.Dataset, path: str) -> xr.Dataset:
+    """
+    Replace the data of the state, forcing and static variables of `ds`
+    (opened from the zarr archive at `path`) with lazily indexed arrays read
+    with TensorStore. Only these (large, float) variables are read with
+    TensorStore, the other variables (e.g. the split names, which are stored
+    as strings that TensorStore can't read) are left as opened by xarray.
+
+    Parameters
+    ----------
+    ds : xr.Dataset
+        The dataset opened from the zarr archive with xarray.
+    path : str
+        The path to the zarr archive.
+
+    Returns
+    -------
+    xr.Dataset
+        The dataset with the state, forcing and static data read with
+        TensorStore.
+
+    """
+    try:
+        # Third-party
+        import tensorstore
+    except ImportError as ex:
+        raise ImportError(
+            "The `tensorstore` zarr backend requires the `tensorstore` "
+            "package to be installed"
+        ) from ex
+
+    # zarr v3 archives have a `zarr.json` metadata file at the root of the
+    # group, v2 archives a `.zgroup` file
+    driver = "zarr3" if (Path(path) / "zarr.json").exists() else "zarr"
+    variables = {}
+    for name in ["state", "forcing", "static"]:
+        if name not in ds:
+            continue
+        da = ds[name]
+        if da.dtype.kind != "f" or {"scale_factor", "add_offset"} & set(
+            da.encoding
+        ):
+            # only plain float values read with TensorStore are the same as
+            # the values decoded by xarray (with missing values as NaN)
+            continue
+        array = tensorstore.open(
+            {
+                "driver": driver,
+                "kvstore": {"driver": "file", "path": str(Path(path) / name)},
+            },
+            read=True,
+        ).result()
+        variables[name] = xr.Variable(
+            da.dims,
+            indexing.LazilyIndexedArray(_TensorStoreBackendArray(array)),
+            attrs=da.attrs,
+            encoding=da.encoding,
+        )
+    return ds.assign(variables)
+
+
+@functools.lru_cache(maxsize=64)
+def _open_zarr_cached(
+    path: str, mtime: float, chunks="auto", backend: str = "zarr"
+):
+    """
+    Open the zarr dataset at `path`, memoized on the path and the modification
+    time of the zarr archive. This means that constructing multiple datastores
+    from the same configuration (for example for each of the splits, or
+    repeatedly in tests) reuses the already opened dataset rather than
+    re-reading the zarr metadata every time, while a regenerated zarr archive
+    (which will have a new modification time) is opened afresh.
+
+    The dataset is opened with `xr.open_zarr` (and so backed by dask arrays)
+    using the consolidated metadata of the archive if available, otherwise
+    the metadata of the individual arrays is read. With the "tensorstore"
+    backend the state, forcing and static data are instead read with
+    TensorStore (without dask), which reads the chunks of the indexed region
+    asynchronously and in parallel, see `_open_with_tensorstore`.
+
+    Parameters
+    ----------
+    path : str
+        The path to the zarr archive.
+    mtime : float
+        The modification time of the zarr archive, only used as part of the
+        cache key.
+    chunks : str or tuple
+        The dask chunking to use when opening the dataset. Either a string
+        understood by `xr.open_zarr` (e.g. "auto") or a tuple of `(dim,
+        chunksize)` pairs (a tuple rather than a dict so that the argument is
+        hashable). Not used for the data read with the "tensorstore" backend.
+    backend : str
+        The backend to open the zarr archive with, either "zarr" or
+        "tensorstore".
+
+    Returns
+    -------
+    xr.Dataset
+        The (lazily loaded) dataset.
+
+    """
+    if backend not in ["zarr", "tensorstore"]:
+        raise ValueError(
+            f"Unknown zarr backend `{backend}`, should be either `zarr` or "
+            "`tensorstore`"
+        )
+
+    if isinstance(chunks, tuple):
+        chunks = dict(chunks)
+
+    try:
+        ds = xr.open_zarr(path, consolidated=True, chunks=chunks)
+    except (KeyError, ValueError):
+        # zarr-python v2 raises KeyError and v3 raises ValueError when the
+        # consolidated metadata is missing
+        logger.warning(
+            f"No consolidated metadata found for {path}, reading metadata of "
+            "individual arrays instead"
+        )
+        ds = xr.open_zarr(path, consolidated=False, chunks=chunks)
+
+    if backend == "tensorstore":
+        ds = _open_with_tensorstore(ds, path=path)
+    return ds
+
+
 class MDPDatastore(BaseRegularGridDatastore):
     """
     Datastore class for datasets made with the mllam_data_prep library
@@ -52,11 +270,21 @@ class MDPDatastore(BaseRegularGridDatastore):
         """
         self._config_path = Path(config_path)
         self._root_path = self._config_path.parent
-        self._config = mdp.Config.from_yaml_file(self._config_path)
+        config_stat = self._config_path.stat()
+        # copy the cached config so that changes to the config of this
+        # datastore don't leak to other datastores using the same file
+        self._config = copy.deepcopy(
+            _load_config_cached(
+                path=str(self._config_path),
+                mtime=config_stat.st_mtime,
+                size=config_stat.st_size,
+            )
+        )
         fp_ds = self._root_path / self._config_path.name.replace(
             ".yaml", ".zarr"
         )
 
+        self._fp_ds = fp_ds
         self._ds = None
         if reuse_existing and fp_ds.exists():
             # check that the zarr directory is newer than the config file
@@ -66,13 +294,31 @@ class MDPDatastore(BaseRegularGridDatastore):
                     f"The old zarr archive (in {fp_ds}) will be used."
                     "To generate new zarr-archive, move the old one first."
                 )
-            self._ds = xr.open_zarr(fp_ds, consolidated=True)
+            self._ds = self._open_zarr()
 
         if self._ds is None:
-            self._ds = mdp.create_dataset(config=self._config)
-            self._ds.to_zarr(fp_ds)
+            mdp.create_dataset(config=self._config).to_zarr(fp_ds)
+            # open the written archive rather than using the created dataset,
+            # so that the data is read the same way (and with the chunks on
+            # disk known) as when an existing archive is reused
+            self._ds = self._open_zarr()
         self._n_boundary_points = n_boundary_points
 
+        # the feature names, units and long names are constant, read them
+        # once here rather than on every call to `get_vars_...`
+        self._vars_cache = {}
+        for category in ["state", "forcing", "static"]:
+            if category not in self._ds:
+                continue
+            self._vars_cache[category] = {
+                attr: self._ds[f"{category}_feature{suffix}"].values.tolist()
+                for attr, suffix in [
+                    ("names", ""),
+                    ("units", "_units"),
+                    ("long_names", "_long_name"),
+                ]
+            }
+
         rank_zero_print("The loaded datastore contains the following features:")
         for category in ["state", "forcing", "static"]:
             if len(self.get_vars_names(category)) > 0:
@@ -88,11 +334,20 @@ class MDPDatastore(BaseRegularGridDatastore):
                 f"splits: {available_splits}"
             )
 
+        # the split time bounds are needed every time data is selected for a
+        # split, read them all at once here and keep them in memory
+        da_splits = self._ds.splits.load()
+        self._split_times = {
+            split: (
+                da_splits.sel(split_name=split, split_part="start").item(),
+                da_splits.sel(split_name=split, split_part="end").item(),
+            )
+            for split in available_splits
+        }
+
         rank_zero_print("With the following splits (over time):")
         for split in required_splits:
-            da_split = self._ds.splits.sel(split_name=split)
-            da_split_start = da_split.sel(split_part="start").load().item()
-            da_split_end = da_split.sel(split_part="end").load().item()
+            da_split_start, da_split_end = self._split_times[split]
             rank_zero_print(f" {split:<8s}: {da_split_start} to {da_split_end}")
 
         # find out the dimension order for the stacking to grid-index
@@ -108,6 +363,42 @@ class MDPDatastore(BaseRegularGridDatastore):
 
         self.CARTESIAN_COORDS = dim_order
 
+    def _open_zarr(self) -> xr.Dataset:
+        """
+        Open the zarr archive of the datastore, see `_open_zarr_cached`.
+
+        Returns
+        -------
+        xr.Dataset
+            The (lazily loaded) dataset.
+        """
+        # by default use dask chunks that are multiples of the chunks on
+        # disk, this can be overridden with the `zarr_chunks` key in the
+        # `extra` section of the config. Setting `zarr_backend` to
+        # "tensorstore" reads the archive with TensorStore instead
+        zarr_chunks = self._config.extra.get("zarr_chunks", "auto")
+        if isinstance(zarr_chunks, dict):
+            zarr_chunks = tuple(zarr_chunks.items())
+        return _open_zarr_cached(
+            path=str(self._fp_ds),
+            mtime=self._fp_ds.stat().st_mtime,
+            chunks=zarr_chunks,
+            backend=self._config.extra.get("zarr_backend", "zarr"),
+        )
+
+    def __getstate__(self):
+        # The dataset isn't pickled (e.g. when sending the datastore to a
+        # DataLoader worker) but is opened again from the zarr archive,
+        # which only reads the metadata rather than pickling the (dask)
+        # graph of the whole dataset
+        state = self.__dict__.copy()
+        del state["_ds"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._ds = self._open_zarr()
+
     @property
     def root_path(self) -> Path:
         """The root path of the dataset.
@@ -142,8 +433,9 @@ class MDPDatastore(BaseRegularGridDatastore):
             The length of the time steps in hours.
 
         """
-        da_dt = self._ds["time"].diff("time")
-        return (da_dt.dt.seconds[0] // 3600).item()
+        # only the first two timestamps are needed to get the step length
+        times = self._ds["time"].isel(time=slice(0, 2)).values
+        return int((times[1] - times[0]) // np.timedelta64(1, "h"))
 
     def get_vars_units(self, category: str) -> List[str]:
         """Return the units of the variables in the given category.
@@ -162,7 +454,7 @@ class MDPDatastore(BaseRegularGridDatastore):
         if category not in self._ds and category == "forcing":
             warnings.warn("no forcing data found in datastore")
             return []
-        return self._ds[f"{category}_feature_units"].values.tolist()
+        return list(self._vars_cache[category]["units"])
 
     def get_vars_names(self, category: str) -> List[str]:
         """Return the names of the variables in the given category.
@@ -181,7 +473,7 @@ class MDPDatastore(BaseRegularGridDatastore):
         if category not in self._ds and category == "forcing":
             warnings.warn("no forcing data found in datastore")
             return []
-        return self._ds[f"{category}_feature"].values.tolist()
+        return list(self._vars_cache[category]["names"])
 
     def get_vars_long_names(self, category: str) -> List[str]:
         """
@@ -201,7 +493,7 @@ class MDPDatastore(BaseRegularGridDatastore):
         if category not in self._ds and category == "forcing":
             warnings.warn("no forcing data found in datastore")
             return []
-        return self._ds[f"{category}_feature_long_name"].values.tolist()
+        return list(self._vars_cache[category]["long_names"])
 
     def get_num_data_vars(self, category: str) -> int:
         """Return the number of variables in the given category.
@@ -219,6 +511,38 @@ class MDPDatastore(BaseRegularGridDatastore):
         """
         return len(self.get_vars_names(category))
 
+    @functools.lru_cache
+    def _get_category_dataarray(self, category: str) -> xr.DataArray:
+        """
+        Return the dataarray for the given category with the grid-index
+        multi-index set and dimensions in the expected order. This is the same
+        for all splits, so it is constructed once per category and the split
+        selection is done in `get_dataarray`.
+
+        Parameters
+        ----------
+        category : str
+            The category of the dataset (state/forcing/static).
+
+        Returns
+        -------
+        xr.DataArray
+            The dataarray for the category, covering all times.
+
+        """
+        da_category = self._ds[category]
+
+        # set units on x y coordinates if missing
+        for coord in ["x", "y"]:
+            if "units" not in da_category[coord].attrs:
+                da_category[coord].attrs["units"] = "m"
+
+        # set multi-index for grid-index
+        da_category = da_category.set_index(grid_index=self.CARTESIAN_COORDS)
+
+        dim_order = self.expected_dim_order(category=category)
+        return da_category.transpose(*dim_order)
+
     def get_dataarray(
         self, category: str, split: str, standardize: bool = False
     ) -> xr.DataArray:
@@ -262,39 +586,62 @@ class MDPDatastore(BaseRegularGridDatastore):
             warnings.warn("no forcing data found in datastore")
             return None
 
-        da_category = self._ds[category]
-
-        # set units on x y coordinates if missing
-        for coord in ["x", "y"]:
-            if "units" not in da_category[coord].attrs:
-                da_category[coord].attrs["units"] = "m"
-
-        # set multi-index for grid-index
-        da_category = da_category.set_index(grid_index=self.CARTESIAN_COORDS)
+        da_category = self._get_category_dataarray(category=category)
 
         if "time" in da_category.dims:
-            t_start = (
-                self._ds.splits.sel(split_name=split)
-                .sel(split_part="start")
-                .load()
-                .item()
-            )
-            t_end = (
-                self._ds.splits.sel(split_name=split)
-                .sel(split_part="end")
-                .load()
-                .item()
-            )
+            t_start, t_end = self._split_times[split]
             da_category = da_category.sel(time=slice(t_start, t_end))
 
-        dim_order = self.expected_dim_order(category=category)
-        da_category = da_category.transpose(*dim_order)
-
         if standardize:
             return self._standardize_datarray(da_category, category=category)
 
         return da_category
 
+    def get_time_chunk_sizes(self, category: str, split: str):
+        """
+        Return the sizes of the chunks that the data of the given category and
+        split is stored in in the zarr archive along the `time` dimension,
+        counted from the first time step of the split. These are the chunks on
+        disk (as set by `output.chunking` in the mllam-data-prep config) rather
+        than the dask chunks of the opened dataset, which by default span many
+        chunks on disk (see `zarr_chunks`).
+
+        Parameters
+        ----------
+        category : str
+            The category of the dataset (state/forcing).
+        split : str
+            The time split to filter the dataset (train/val/test).
+
+        Returns
+        -------
+        Tuple[int, ...] or None
+            The sizes of the stored chunks along `time`, or None if the
+            category has no time dimension or the chunks on disk aren't known.
+
+        """
+        if category not in self._ds or "time" not in self._ds[category].dims:
+            return None
+        chunk_size = (
+            self._ds[category].encoding.get("preferred_chunks", {}).get("time")
+        )
+        if chunk_size is None:
+            return None
+
+        # the split generally doesn't start at a chunk boundary, so find the
+        # position of its first time step in the archive
+        split_times = self.get_dataarray(category=category, split=split).time
+        i_start = int(
+            np.searchsorted(self._ds.time.values, split_times.values[0])
+        )
+        i_end = i_start + split_times.size
+        chunk_bounds = np.arange(
+            (i_start // chunk_size + 1) * chunk_size, i_end, chunk_size
+        )
+        chunk_bounds = np.concatenate([[i_start], chunk_bounds, [i_end]])
+        return tuple(int(n) for n in np.diff(chunk_bounds))
+
+    @functools.lru_cache
     def get_standardization_dataarray(self, category: str) -> xr.Dataset:
         """
         Return the standardization dataarray for the given category. This
@@ -322,20 +669,28 @@ class MDPDatastore(BaseRegularGridDatastore):
         stats_variables = {
             f"{category}__{split}__{op}": f"{category}_{op}" for op in ops
         }
+        if category == "state":
+            stats_variables.update(
+                {f"state__{split}__diff_{op}": f"state_diff_{op}" for op in ops}
+            )
 
-        ds_stats = self._ds[stats_variables.keys()].rename(stats_variables)
+        # select only the statistics needed for this category and load them
+        # together, they are small and are used every time data is
+        # standardized so there is no reason to keep them lazy
+        ds_stats = self._ds[list(stats_variables.keys())].load()
+        ds_stats = ds_stats.rename(stats_variables)
 
         # Add standardized state diff stats
         if category == "state":
             ds_stats = ds_stats.assign(
                 **{
-                    f"state_diff_{op}_standardized": self._ds[
-                        f"state__{split}__diff_{op}"
+                    f"state_diff_{op}_standardized": ds_stats[
+                        f"state_diff_{op}"
                     ]
                     / ds_stats["state_std"]
                     for op in ops
                 }
-            )
+            ).drop_vars([f"state_diff_{op}" for op in ops])
 
         return ds_stats
 
@@ -356,19 +711,28 @@ class MDPDatastore(BaseRegularGridDatastore):
             boundary point and 0 is not.
 
         """
-        ds_unstacked = self.unstack_grid_coords(da_or_ds=self._ds)
-        da_state_variable = (
-            ds_unstacked["state"].isel(time=0).isel(state_feature=0)
-        )
-        da_domain_allzero = xr.zeros_like(da_state_variable)
-        ds_unstacked["boundary_mask"] = da_domain_allzero.isel(
-            x=slice(self._n_boundary_points, -self._n_boundary_points),
-            y=slice(self._n_boundary_points, -self._n_boundary_points),
+        # only the x and y coordinates of the grid points are needed, find the
+        # position of each grid point along x and y in the (sorted) unique
+        # coordinate values, as they would be placed when unstacking
+        grid_coords = self._read_grid_coords()
+        n = self._n_boundary_points
+        is_interior = True
+        for coord in ["x", "y"]:
+            values = grid_coords[coord]
+            unique_values = np.unique(values)
+            is_interior_1d = np.zeros(unique_values.size, dtype=bool)
+            is_interior_1d[n:-n] = True
+            is_interior = (
+                is_interior
+                & is_interior_1d[np.searchsorted(unique_values, values)]
+            )
+
+        return xr.DataArray(
+            (~is_interior).astype(int),
+            dims=("grid_index",),
+            coords={c: ("grid_index", v) for c, v in grid_coords.items()},
+            name="boundary_mask",
         )
-        ds_unstacked["boundary_mask"] = ds_unstacked.boundary_mask.fillna(
-            1
-        ).astype(int)
-        return self.stack_grid_coords(da_or_ds=ds_unstacked.boundary_mask)
 
     @property
     def coords_projection(self) -> ccrs.Projection:
@@ -440,6 +804,27 @@ class MDPDatastore(BaseRegularGridDatastore):
         assert da_x.ndim == da_y.ndim == 1
         return CartesianGridShape(x=da_x.size, y=da_y.size)
 
+    def _read_grid_coords(self) -> Dict[str, ndarray]:
+        """
+        Read the `x` and `y` coordinates of the grid points (along
+        `grid_index`) directly from the zarr archive, bypassing xarray.
+
+        Returns
+        -------
+        Dict[str, np.ndarray]
+            The 1D `x` and `y` coordinate values of the grid points.
+
+        """
+        group = _open_zarr_group_cached(
+            path=str(self._fp_ds), mtime=self._fp_ds.stat().st_mtime
+        )
+        grid_coords = {coord: group[coord][:] for coord in ["x", "y"]}
+        assert all(
+            v.ndim == 1 for v in grid_coords.values()
+        ), "x and y coordinates must be 1D"
+        return grid_coords
+
+    @functools.lru_cache
     def get_xy(self, category: str, stacked: bool) -> ndarray:
         """Return the x, y coordinates of the dataset.
 
@@ -460,28 +845,28 @@ class MDPDatastore(BaseRegularGridDatastore):
             - `stacked==False`: shape `(N_x, N_y, 2)`
 
         """
-        # assume variables are stored in dimensions [grid_index, ...]
-        ds_category = self.unstack_grid_coords(da_or_ds=self._ds[category])
-
-        da_xs = ds_category.x
-        da_ys = ds_category.y
-
-        assert da_xs.ndim == da_ys.ndim == 1, "x and y coordinates must be 1D"
-
-        da_x, da_y = xr.broadcast(da_xs, da_ys)
-        da_xy = xr.concat([da_x, da_y], dim="grid_coord")
+        # assume variables are stored in dimensions [grid_index, ...], all
+        # categories share the same grid-index coordinates
+        if category not in self._ds:
+            raise KeyError(f"No {category} data found in datastore")
+        grid_coords = self._read_grid_coords()
+
+        # the grid is the product of the unique x and y values (as when
+        # unstacking the grid-index), fill in the `(N_x, N_y, 2)` array
+        # directly by broadcasting rather than through xarray
+        xs = np.unique(grid_coords["x"])
+        ys = np.unique(grid_coords["y"])
+        xy = np.empty((xs.size, ys.size, 2), dtype=np.result_type(xs, ys))
+        xy[:, :, 0] = xs[:, None]
+        xy[:, :, 1] = ys[None, :]
 
         if stacked:
-            da_xy = da_xy.stack(grid_index=self.CARTESIAN_COORDS).transpose(
-                "grid_index",
-                "grid_coord",
-            )
-        else:
-            dims = [
-                "x",
-                "y",
-                "grid_coord",
-            ]
-            da_xy = da_xy.transpose(*dims)
-
-        return da_xy.values
+            # stack in the order of `CARTESIAN_COORDS`, the first coordinate
+            # varying slowest
+            if list(self.CARTESIAN_COORDS) == ["y", "x"]:
+                xy = xy.transpose(1, 0, 2)
+            xy = xy.reshape(-1, 2)
+
+        # the result is cached and so shared between callers
+        xy.flags.writeable = False
+        return xy
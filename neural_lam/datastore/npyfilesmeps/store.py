@@ -231,6 +231,14 @@ class NpyFilesDatastoreMEPS(BaseRegularGridDatastore):
             static:    `[grid_index, feature]`
 
         """
+        # all the dataarrays being concatenated below are read for the same
+        # split and so share the same coordinates along all dimensions other
+        # than the one being concatenated, aligning them (and comparing their
+        # coordinate values) is therefore unnecessary
+        concat_kwargs = dict(
+            coords="minimal", compat="override", join="override"
+        )
+
         if category == "state":
             das = []
             # for the state category, we need to load all ensemble members
@@ -241,7 +249,7 @@ class NpyFilesDatastoreMEPS(BaseRegularGridDatastore):
                     member=member,
                 )
                 das.append(da_member)
-            da = xr.concat(das, dim="ensemble_member")
+            da = xr.concat(das, dim="ensemble_member", **concat_kwargs)
 
         elif category == "forcing":
             # the forcing features are in separate files, so we need to load
@@ -253,7 +261,7 @@ class NpyFilesDatastoreMEPS(BaseRegularGridDatastore):
                 )
                 for feature in features
             ]
-            da = xr.concat(das, dim="feature")
+            da = xr.concat(das, dim="feature", **concat_kwargs)
 
             # add datetime forcing as a feature
             # to do this we create a forecast time variable which has the
@@ -286,7 +294,7 @@ class NpyFilesDatastoreMEPS(BaseRegularGridDatastore):
                     features=features, split=split
                 )
                 das.append(da)
-            da = xr.concat(das, dim="feature")
+            da = xr.concat(das, dim="feature", **concat_kwargs)
 
         else:
             raise NotImplementedError(category)
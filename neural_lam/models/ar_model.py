@@ -37,6 +37,9 @@ class ARModel(pl.LightningModule):
         self.save_hyperparameters(ignore=["datastore"])
         self.args = args
         self._datastore = datastore
+        # WeatherDataset instances (per split) used for converting tensors to
+        # dataarrays, created on first use
+        self._weather_datasets = {}
         num_state_vars = datastore.get_num_data_vars(category="state")
         num_forcing_vars = datastore.get_num_data_vars(category="forcing")
         # Load static features standardized
@@ -179,10 +182,15 @@ class ARModel(pl.LightningModule):
         category : str
             The category of the data, either 'state' or 'forcing'
         """
-        # TODO: creating an instance of WeatherDataset here on every call is
-        # not how this should be done but whether WeatherDataset should be
-        # provided to ARModel or where to put plotting still needs discussion
-        weather_dataset = WeatherDataset(datastore=self._datastore, split=split)
+        # TODO: whether WeatherDataset should be provided to ARModel or where
+        # to put plotting still needs discussion. Until then one instance is
+        # created per split and reused, since creating it loads the
+        # dataarrays for the split from the datastore
+        if split not in self._weather_datasets:
+            self._weather_datasets[split] = WeatherDataset(
+                datastore=self._datastore, split=split
+            )
+        weather_dataset = self._weather_datasets[split]
         time = np.array(time.cpu(), dtype="datetime64[ns]")
         da = weather_dataset.create_dataarray_from_tensor(
             tensor=tensor, time=time, category=category
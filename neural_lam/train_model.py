@@ -50,6 +50,20 @@ def main(input_args=None):
         default=4,
         help="Number of workers in data loader (default: 4)",
     )
+    parser.add_argument(
+        "--dataset_cache_dir",
+        type=str,
+        default=None,
+        help="Directory to cache the training data in as uncompressed "
+        "float32 files, which are memory-mapped when loading samples. "
+        "The cache is created on first use (default: None, no cache)",
+    )
+    parser.add_argument(
+        "--chunk_aware_sampling",
+        action="store_true",
+        help="Shuffle the training samples by chunk of the data store, so "
+        "that batches read few chunks (default: false)",
+    )
     parser.add_argument(
         "--num_nodes",
         type=int,
@@ -262,6 +276,8 @@ def main(input_args=None):
         num_future_forcing_steps=args.num_future_forcing_steps,
         batch_size=args.batch_size,
         num_workers=args.num_workers,
+        cache_dir=args.dataset_cache_dir,
+        chunk_aware_sampling=args.chunk_aware_sampling,
     )
 
     # Instantiate model + trainer
@@ -1,6 +1,10 @@
 # Standard library
 import datetime
+import hashlib
+import json
+import os
 import warnings
+from pathlib import Path
 from typing import Union
 
 # Third-party
@@ -38,6 +42,13 @@ class WeatherDataset(torch.utils.data.Dataset):
         t. Default is 1.
     standardize : bool, optional
         Whether to standardize the data. Default is True.
+    cache_dir : str or Path, optional
+        Directory to cache the state and forcing data of the split in, as
+        uncompressed float32 files that are memory-mapped when reading
+        samples. The cache is written on first use (see
+        `_materialize_cache`), and again if the data it was made from has
+        changed (see `_cache_header`). If None (default) the data is read
+        from the datastore.
     """
 
     def __init__(
@@ -48,6 +59,7 @@ class WeatherDataset(torch.utils.data.Dataset):
         num_past_forcing_steps=1,
         num_future_forcing_steps=1,
         standardize=True,
+        cache_dir=None,
     ):
         super().__init__()
 
@@ -57,12 +69,15 @@ class WeatherDataset(torch.utils.data.Dataset):
         self.num_past_forcing_steps = num_past_forcing_steps
         self.num_future_forcing_steps = num_future_forcing_steps
 
-        self.da_state = self.datastore.get_dataarray(
-            category="state", split=self.split
-        )
-        self.da_forcing = self.datastore.get_dataarray(
-            category="forcing", split=self.split
-        )
+        self._open_dataarrays()
+
+        if self.datastore.is_ensemble:
+            # only the first ensemble member is used when creating samples,
+            # this is warned about once here rather than for every sample
+            warnings.warn(
+                "only use of ensemble member 0 (the first member) is "
+                "implemented for ensemble data"
+            )
 
         # check that with the provided data-arrays and ar_steps that we have a
         # non-zero amount of samples
@@ -94,6 +109,56 @@ class WeatherDataset(torch.utils.data.Dataset):
                     "the data in `BaseDatastore.get_dataarray`?"
                 )
 
+        # The times are kept as int64 nanoseconds since the epoch, which is
+        # the form the target times of the samples are returned in
+        if self.datastore.is_forecast:
+            self._analysis_times_ns = self._to_ns(
+                self.da_state.analysis_time.values
+            )
+            self._forecast_durations_ns = self._to_ns(
+                self.da_state.elapsed_forecast_duration.values
+            )
+        else:
+            self._state_times_ns = self._to_ns(self.da_state.time.values)
+
+        # The shapes and offsets that are the same for every sample are
+        # worked out once here rather than in `__getitem__`. The forcing of a
+        # sample is read as one contiguous block (see `_get_forcing_values`)
+        # starting at `_forcing_block_offset` past the start of the sample
+        self._n_grid = self.da_state.grid_index.size
+        self._forcing_window_size = (
+            self.num_past_forcing_steps + self.num_future_forcing_steps + 1
+        )
+        # The current implementation requires at least 2 time steps for the
+        # initial state (see GraphCast)
+        init_steps = 2
+        self._forcing_block_offset = (
+            max(init_steps, self.num_past_forcing_steps)
+            - self.num_past_forcing_steps
+        )
+
+        # Optionally read the samples from memory-mapped float32 copies of
+        # the data instead, which avoids decompressing the data again every
+        # time a sample is read
+        self.cache_dir = None if cache_dir is None else Path(cache_dir)
+        self._cache_headers = {}
+        self._cache_paths = {}
+        if self.cache_dir is not None:
+            datastore_id = self._datastore_fingerprint()
+            for category, da in parts.items():
+                # the cache files of different datastores are kept apart by
+                # the datastore fingerprint in the file name
+                path = (
+                    self.cache_dir
+                    / f"{self.split}_{category}_{datastore_id[:16]}.f32"
+                )
+                header = self._cache_header(da, datastore_id=datastore_id)
+                if self._read_cache_header(path) != header:
+                    self._materialize_cache(da, path, header=header)
+                self._cache_headers[category] = header
+                self._cache_paths[category] = path
+            self._open_cache()
+
         # Set up for standardization
         # TODO: This will become part of ar_model.py soon!
         self.standardize = standardize
@@ -114,6 +179,362 @@ class WeatherDataset(torch.utils.data.Dataset):
                 self.da_forcing_mean = self.ds_forcing_stats.forcing_mean
                 self.da_forcing_std = self.ds_forcing_stats.forcing_std
 
+            # The statistics are also kept as tensors (with the feature
+            # dimension last) so that `__getitem__` can standardize the
+            # sample tensors directly rather than through xarray. The forcing
+            # is standardized before being split into windows, so its
+            # statistics aren't repeated over the window
+            self._state_stats = self._stats_to_tensors(
+                self.da_state_mean, self.da_state_std, category="state"
+            )
+            if self.da_forcing is not None:
+                self._forcing_stats = self._stats_to_tensors(
+                    self.da_forcing_mean,
+                    self.da_forcing_std,
+                    category="forcing",
+                )
+
+    @staticmethod
+    def _to_ns(values):
+        """
+        Convert an array of datetimes or timedeltas to int64 nanoseconds
+        (since the epoch for datetimes).
+
+        Parameters
+        ----------
+        values : np.ndarray
+            The datetime64 or timedelta64 values to convert.
+
+        Returns
+        -------
+        np.ndarray
+            The values as int64 nanoseconds.
+        """
+        unit = (
+            "datetime64[ns]" if values.dtype.kind == "M" else "timedelta64[ns]"
+        )
+        return values.astype(unit).view(np.int64)
+
+    def _datastore_fingerprint(self):
+        """
+        Return a fingerprint of the datastore the data is read from, made
+        from its kind, root path and configuration, used to tell apart the
+        cached data of different datastores.
+
+        Returns
+        -------
+        str
+            The hex digest identifying the datastore.
+        """
+        # not all datastores have a root path, the cached data of these is
+        # still told apart by the data checksum, see `_data_checksum`
+        root_path = self.datastore.root_path
+        if root_path is not None:
+            root_path = Path(root_path).resolve()
+        datastore_desc = "\n".join(
+            [
+                type(self.datastore).__name__,
+                str(root_path),
+                repr(self.datastore.config),
+            ]
+        )
+        return hashlib.sha256(datastore_desc.encode()).hexdigest()
+
+    @staticmethod
+    def _grid_fingerprint(da):
+        """
+        Return a fingerprint of the grid of `da`, made from the values of
+        all its coordinates along `grid_index` (e.g. the x and y coordinates
+        of each grid point).
+
+        Parameters
+        ----------
+        da : xr.DataArray
+            The data to fingerprint the grid of.
+
+        Returns
+        -------
+        str
+            The hex digest identifying the grid.
+        """
+        grid_hash = hashlib.sha256()
+        for name in sorted(map(str, da.coords)):
+            if da.coords[name].dims != ("grid_index",):
+                continue
+            values = da.coords[name].values
+            grid_hash.update(name.encode())
+            if values.dtype.kind == "O":
+                grid_hash.update(repr(values.tolist()).encode())
+            else:
+                grid_hash.update(np.ascontiguousarray(values).tobytes())
+        return grid_hash.hexdigest()
+
+    @staticmethod
+    def _data_checksum(da):
+        """
+        Return a checksum of the values (as float32, as in the cache) of the
+        first and last step along the first (time) dimension of `da`. This
+        ties the cache to the data itself, so that the cache of data that has
+        since been regenerated (e.g. a zarr archive created again from
+        updated inputs with the same config) isn't used.
+
+        Parameters
+        ----------
+        da : xr.DataArray
+            The data to checksum.
+
+        Returns
+        -------
+        str
+            The hex digest of the first and last step of the data.
+        """
+        data_hash = hashlib.sha256()
+        for i in [0, -1]:
+            values = da.variable[i].values.astype(np.float32)
+            data_hash.update(np.ascontiguousarray(values).tobytes())
+        return data_hash.hexdigest()
+
+    def _cache_header(self, da, datastore_id):
+        """
+        Return the header describing the cached copy of `da`, used both for
+        memory-mapping the cache file and for checking that an existing cache
+        file matches the data.
+
+        Parameters
+        ----------
+        da : xr.DataArray
+            The data to cache.
+        datastore_id : str
+            The fingerprint of the datastore, see `_datastore_fingerprint`.
+
+        Returns
+        -------
+        dict
+            The dtype, shape and dimensions of the cached data, the
+            coordinate values along the time and feature dimensions,
+            fingerprints of the datastore and grid the data is from, and a
+            checksum of the data.
+        """
+        header = dict(
+            dtype="float32",
+            shape=list(da.shape),
+            dims=list(da.dims),
+            datastore=datastore_id,
+            grid=self._grid_fingerprint(da),
+            data=self._data_checksum(da),
+        )
+        for dim in da.dims:
+            if dim == "grid_index" or dim not in da.coords:
+                continue
+            header[dim] = [str(v) for v in da.coords[dim].values]
+        return header
+
+    @staticmethod
+    def _read_cache_header(path):
+        """
+        Read the header of the cache file at `path`, returning None if the
+        cache hasn't been written yet.
+
+        Parameters
+        ----------
+        path : Path
+            Path to the cache file.
+
+        Returns
+        -------
+        dict or None
+            The header of the cache file.
+        """
+        header_path = path.with_suffix(".json")
+        if not (header_path.exists() and path.exists()):
+            return None
+        with open(header_path) as fh:
+            return json.load(fh)
+
+    @staticmethod
+    def _materialize_cache(da, path, header, n_steps_per_write=16):
+        """
+        Write the values of `da` to `path` as a C-contiguous float32 binary
+        file, together with a JSON header (with the same name but `.json`
+        suffix) describing the data. The data is read along the first
+        (time) dimension in blocks, so that only a block is held in memory at
+        a time. Both files are written to temporary files first and then
+        moved into place, so that a partially written cache is never used.
+
+        Parameters
+        ----------
+        da : xr.DataArray
+            The data to cache.
+        path : Path
+            Path to write the cache file to.
+        header : dict
+            The header describing the cached data, see `_cache_header`.
+        n_steps_per_write : int, optional
+            Number of steps along the first dimension to read and write at a
+            time. Default is 16.
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".tmp{os.getpid()}")
+        values = np.memmap(
+            tmp_path, dtype=np.float32, mode="w+", shape=da.shape
+        )
+        # index the (lazy) variable rather than `da.data`, which would load
+        # all of the data into memory for lazy backends not using dask
+        variable = da.variable
+        for start in range(0, da.shape[0], n_steps_per_write):
+            end = start + n_steps_per_write
+            values[start:end] = variable[start:end].values
+        values.flush()
+        del values
+        os.replace(tmp_path, path)
+
+        tmp_header_path = path.with_suffix(f".json.tmp{os.getpid()}")
+        with open(tmp_header_path, "w") as fh:
+            json.dump(header, fh)
+        os.replace(tmp_header_path, path.with_suffix(".json"))
+
+    def _open_cache(self):
+        """
+        Memory-map the cache files of the state and forcing data, replacing
+        the variables samples are read from.
+        """
+        for category, header in self._cache_headers.items():
+            values = np.memmap(
+                self._cache_paths[category],
+                dtype=header["dtype"],
+                mode="r",
+                shape=tuple(header["shape"]),
+            )
+            setattr(
+                self, f"_{category}_data", xr.Variable(header["dims"], values)
+            )
+
+    def _open_dataarrays(self):
+        """
+        Get the state and forcing data of the split from the datastore.
+        """
+        self.da_state = self.datastore.get_dataarray(
+            category="state", split=self.split
+        )
+        self.da_forcing = self.datastore.get_dataarray(
+            category="forcing", split=self.split
+        )
+
+        # Keep the underlying variables so that samples can be sliced from
+        # these by position in `__getitem__` without the overhead of
+        # xarray's coordinate handling. The variables (rather than their
+        # `.data`) are kept since for lazily loaded data that isn't backed by
+        # dask (e.g. zarr opened without chunks, or with TensorStore)
+        # accessing `.data` loads the whole split into memory, whereas
+        # indexing the variable only reads the values of the sample
+        self._state_data = self.da_state.variable
+        self._forcing_data = None
+        if self.da_forcing is not None:
+            self._forcing_data = self.da_forcing.variable
+
+    def __getstate__(self):
+        # The data arrays (and the memory-mapped cache files) aren't pickled
+        # when the dataset is sent to a DataLoader worker, but are opened
+        # again in the worker from the datastore. This avoids pickling the
+        # (dask) graphs of lazily loaded data, or the data itself, for every
+        # worker
+        state = self.__dict__.copy()
+        for attr in ["da_state", "da_forcing", "_state_data", "_forcing_data"]:
+            state.pop(attr, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open_dataarrays()
+        if self._cache_headers:
+            self._open_cache()
+
+    @staticmethod
+    def _stats_to_tensors(da_mean, da_std, category, window_size=1):
+        """
+        Convert the mean and standard deviation used for standardizing
+        `category` data to tensors with the `{category}_feature` dimension
+        last, so that they broadcast against the sample tensors. The
+        reciprocal of the standard deviation is stored so that standardizing
+        only needs a subtraction and a multiplication.
+
+        For windowed (forcing) data the features are stacked with the window
+        index varying fastest, so each statistic is repeated `window_size`
+        times along the feature dimension.
+
+        Parameters
+        ----------
+        da_mean : xr.DataArray
+            The mean of the data.
+        da_std : xr.DataArray
+            The standard deviation of the data.
+        category : str
+            The category of the data (state/forcing).
+        window_size : int, optional
+            The number of time steps in each window of the data. Default is 1.
+
+        Returns
+        -------
+        mean : torch.Tensor
+            The mean of the data.
+        std_inv : torch.Tensor
+            The reciprocal of the standard deviation of the data.
+        """
+        feature_dim = f"{category}_feature"
+        mean = torch.from_numpy(
+            np.ascontiguousarray(da_mean.transpose(..., feature_dim).values)
+        )
+        std_inv = 1.0 / torch.from_numpy(
+            np.ascontiguousarray(da_std.transpose(..., feature_dim).values)
+        )
+        if window_size > 1:
+            mean = mean.repeat_interleave(window_size, dim=-1)
+            std_inv = std_inv.repeat_interleave(window_size, dim=-1)
+        return mean, std_inv
+
+    @staticmethod
+    def _to_tensor(values, stats=None):
+        """
+        Convert a numpy array of sample data to a float32 tensor, optionally
+        standardizing it with the given statistics.
+
+        Parameters
+        ----------
+        values : np.ndarray
+            The values to convert.
+        stats : tuple of torch.Tensor, optional
+            The mean and reciprocal of the standard deviation to standardize
+            with, as returned by `_stats_to_tensors`. If None the values are
+            not standardized.
+
+        Returns
+        -------
+        torch.Tensor
+            The (standardized) values as a float32 tensor.
+        """
+        tensor_dtype = torch.float32
+        values = np.asarray(values)
+        if stats is None:
+            if values.flags.owndata and values.flags.writeable:
+                # the array was created for this sample, so the tensor can
+                # share its memory and only needs converting if the dtype
+                # differs
+                return torch.from_numpy(np.ascontiguousarray(values)).to(
+                    tensor_dtype
+                )
+            # the array may be a view of the data held by the datastore,
+            # which must not be shared with the returned tensor
+            return torch.tensor(values, dtype=tensor_dtype)
+
+        mean, std_inv = stats
+        # the values are copied (since `values` may be a view of the data
+        # held by the datastore) and standardized in-place, in the precision
+        # of the data and statistics before converting to float32
+        compute_dtype = np.result_type(values.dtype, mean.numpy().dtype)
+        tensor = torch.from_numpy(values.astype(compute_dtype, copy=True))
+        tensor.sub_(mean).mul_(std_inv)
+        return tensor.to(tensor_dtype)
+
     def __len__(self):
         if self.datastore.is_forecast:
             # for now we simply create a single sample for each analysis time
@@ -160,6 +581,39 @@ class WeatherDataset(torch.utils.data.Dataset):
                 - self.num_future_forcing_steps
             )
 
+    def _state_time_range(self, idx, n_steps: int):
+        """
+        Return the start and end index (along `time` for analysis data and
+        along `elapsed_forecast_duration` for forecast data) of the state time
+        steps of the sample starting at `idx` with `n_steps` steps, see
+        `_slice_state_time`.
+
+        Parameters
+        ----------
+        idx : int
+            The index of the time step to start the sample from.
+        n_steps : int
+            The number of time steps to include in the sample.
+
+        Returns
+        -------
+        start_idx : int
+            The index of the first state time step of the sample.
+        end_idx : int
+            The index after the last state time step of the sample.
+        """
+        # The current implementation requires at least 2 time steps for the
+        # initial state (see GraphCast).
+        init_steps = 2
+        start_idx = max(0, self.num_past_forcing_steps - init_steps)
+        end_idx = max(init_steps, self.num_past_forcing_steps) + n_steps
+        if not self.datastore.is_forecast:
+            # For analysis data the sample is offset by `idx` along the time
+            # dimension, for forecast data `idx` selects the analysis time
+            start_idx += idx
+            end_idx += idx
+        return start_idx, end_idx
+
     def _slice_state_time(self, da_state, idx, n_steps: int):
         """
         Produce a time slice of the given dataarray `da_state` (state) starting
@@ -167,7 +621,8 @@ class WeatherDataset(torch.utils.data.Dataset):
         `num_past_forcing_steps` class attribute. `Offset` is used to offset the
         start of the sample, to assert that enough previous time steps are
         available for the 2 initial states and any corresponding forcings
-        (calculated in `_slice_forcing_time`).
+        (calculated in `_slice_forcing_time`). Only used by the reference
+        implementation `_build_item_dataarrays`.
 
         Parameters
         ----------
@@ -187,13 +642,9 @@ class WeatherDataset(torch.utils.data.Dataset):
             The sliced dataarray with dims ('time', 'grid_index',
             'state_feature').
         """
-        # The current implementation requires at least 2 time steps for the
-        # initial state (see GraphCast).
-        init_steps = 2
         # slice the dataarray to include the required number of time steps
+        start_idx, end_idx = self._state_time_range(idx=idx, n_steps=n_steps)
         if self.datastore.is_forecast:
-            start_idx = max(0, self.num_past_forcing_steps - init_steps)
-            end_idx = max(init_steps, self.num_past_forcing_steps) + n_steps
             # this implies that the data will have both `analysis_time` and
             # `elapsed_forecast_duration` dimensions for forecasts. We for now
             # simply select a analysis time and the first `n_steps` forecast
@@ -215,10 +666,6 @@ class WeatherDataset(torch.utils.data.Dataset):
             # For analysis data we slice the time dimension directly. The offset
             # is only relevant for the very first (and last) samples in the
             # dataset.
-            start_idx = idx + max(0, self.num_past_forcing_steps - init_steps)
-            end_idx = (
-                idx + max(init_steps, self.num_past_forcing_steps) + n_steps
-            )
             da_sliced = da_state.isel(time=slice(start_idx, end_idx))
         return da_sliced
 
@@ -230,7 +677,8 @@ class WeatherDataset(torch.utils.data.Dataset):
         offset the start of the sample, to ensure that enough previous time
         steps are available for the forcing data. The forcing data is windowed
         around the current autoregressive time step to include the past and
-        future forcings.
+        future forcings. Only used by the reference implementation
+        `_build_item_dataarrays`.
 
         Parameters
         ----------
@@ -335,6 +783,12 @@ class WeatherDataset(torch.utils.data.Dataset):
         Create the dataarrays for the initial states, target states and forcing
         data for the sample at index `idx`.
 
+        This is a reference implementation of the sample creation done with
+        xarray (together with `_slice_state_time` and `_slice_forcing_time`).
+        It isn't used by `__getitem__`, which indexes the underlying data by
+        position instead, but is kept to check `__getitem__` against in the
+        tests.
+
         Parameters
         ----------
         idx : int
@@ -440,18 +894,126 @@ class WeatherDataset(torch.utils.data.Dataset):
             da_target_times,
         )
 
+    def _get_state_values(self, idx, n_steps: int):
+        """
+        Return the values and times of the state time steps of the sample
+        starting at `idx` with `n_steps` steps (in addition to the two initial
+        states). This gives the same result as `_slice_state_time` (with the
+        first ensemble member selected for ensemble data) but indexes the
+        underlying array by position.
+
+        Parameters
+        ----------
+        idx : int
+            The index of the time step to start the sample from.
+        n_steps : int
+            The number of time steps to include in the sample.
+
+        Returns
+        -------
+        values : np.ndarray
+            The state values with dimensions (time, grid_index,
+            state_feature).
+        times : np.ndarray
+            The times of the state time steps, as int64 nanoseconds since the
+            epoch.
+        """
+        start_idx, end_idx = self._state_time_range(idx=idx, n_steps=n_steps)
+        if self.datastore.is_forecast:
+            key = (idx, slice(start_idx, end_idx))
+            times = (
+                self._analysis_times_ns[idx]
+                + self._forecast_durations_ns[start_idx:end_idx]
+            )
+        else:
+            key = (slice(start_idx, end_idx),)
+            times = self._state_times_ns[start_idx:end_idx]
+
+        if self.datastore.is_ensemble:
+            # only the first ensemble member is used (see
+            # `_build_item_dataarrays`), which is warned about once in
+            # `__init__` rather than for every sample
+            key = key + (0,)
+
+        return self._state_data[key].values, times
+
+    def _get_forcing_values(self, idx, n_steps: int, stats=None):
+        """
+        Return the windowed forcing values of the sample starting at `idx`
+        with `n_steps` steps, with the `forcing_feature` and `window`
+        dimensions stacked into a single feature dimension.
+
+        Parameters
+        ----------
+        idx : int
+            The index of the time step to start the sample from.
+        n_steps : int
+            The number of time steps to include in the sample.
+        stats : tuple of torch.Tensor, optional
+            The (not windowed) statistics to standardize the forcing with, see
+            `_to_tensor`. The forcing is standardized before being split into
+            windows, so that each time step is only standardized once rather
+            than once for every window it is part of. If None the values are
+            not standardized.
+
+        Returns
+        -------
+        np.ndarray
+            The forcing values with dimensions (time, grid_index,
+            forcing_feature_windowed).
+        """
+        if self.da_forcing is None:
+            return np.empty((n_steps, self._n_grid, 0))
+
+        if "ensemble_member" in self.da_forcing.dims:
+            raise NotImplementedError(
+                "Ensemble member not yet supported for forcing data"
+            )
+
+        # The windows of consecutive steps overlap, so all the forcing time
+        # steps needed for the sample are read as one contiguous block (see
+        # `_slice_forcing_time` for the offsets)
+        window_size = self._forcing_window_size
+        start_idx = self._forcing_block_offset
+        end_idx = start_idx + n_steps + window_size - 1
+        if self.datastore.is_forecast:
+            key = (idx, slice(start_idx, end_idx))
+        else:
+            key = (slice(idx + start_idx, idx + end_idx),)
+        forcing_block = self._forcing_data[key].values
+        if stats is not None:
+            forcing_block = self._to_tensor(forcing_block, stats).numpy()
+
+        # Take the overlapping windows as a zero-copy strided view with
+        # dimensions (time, grid_index, forcing_feature, window) and copy
+        # them once into an array with the window index varying fastest
+        # along the last dimension, i.e. the same layout as stacking
+        # `("forcing_feature", "window")` in the xarray implementation. The
+        # copy goes into a preallocated array (rather than reshaping the
+        # view) so that the result owns its memory, see `_to_tensor`
+        n_grid, n_features = forcing_block.shape[1:]
+        forcing_windows = np.lib.stride_tricks.sliding_window_view(
+            forcing_block, window_size, axis=0
+        )
+        forcing_values = np.empty(
+            (n_steps, n_grid, n_features * window_size),
+            dtype=forcing_block.dtype,
+        )
+        np.copyto(
+            forcing_values.reshape(forcing_windows.shape), forcing_windows
+        )
+        return forcing_values
+
     def __getitem__(self, idx):
         """
         Return a single training sample, which consists of the initial states,
         target states, forcing and batch times.
 
-        The implementation currently uses xarray.DataArray objects for the
-        standardization (scaling to mean 0.0 and standard deviation of 1.0) so
-        that we can make us of xarray's broadcasting capabilities. This makes
-        it possible to standardization with both global means, but also for
-        example where a grid-point mean has been computed. This code will have
-        to be replace if standardization is to be done on the GPU to handle
-        different shapes of the standardization.
+        The standardization (scaling to mean 0.0 and standard deviation of
+        1.0) is done on the sample tensors using the statistics prepared in
+        `__init__`, which broadcast over the leading dimensions. This makes it
+        possible to standardize with both global means, but also for example
+        where a grid-point mean has been computed.
 
         Parameters
         ----------
@@ -467,26 +1029,26 @@ class WeatherDataset(torch.utils.data.Dataset):
             the target steps.
 
         """
-        (
-            da_init_states,
-            da_target_states,
-            da_forcing_windowed,
-            da_target_times,
-        ) = self._build_item_dataarrays(idx=idx)
-
-        tensor_dtype = torch.float32
-
-        init_states = torch.tensor(da_init_states.values, dtype=tensor_dtype)
-        target_states = torch.tensor(
-            da_target_states.values, dtype=tensor_dtype
+        state_values, state_times = self._get_state_values(
+            idx=idx, n_steps=self.ar_steps
         )
+        state_stats, forcing_stats = None, None
+        if self.standardize:
+            state_stats = self._state_stats
+            if self.da_forcing is not None:
+                forcing_stats = self._forcing_stats
 
-        target_times = torch.tensor(
-            da_target_times.astype("datetime64[ns]").astype("int64").values,
-            dtype=torch.int64,
+        forcing_values = self._get_forcing_values(
+            idx=idx, n_steps=self.ar_steps, stats=forcing_stats
         )
 
-        forcing = torch.tensor(da_forcing_windowed.values, dtype=tensor_dtype)
+        states = self._to_tensor(state_values, state_stats)
+        init_states = states[:2]
+        target_states = states[2:]
+
+        target_times = torch.from_numpy(state_times[2:].copy())
+
+        forcing = self._to_tensor(forcing_values)
 
         # init_states: (2, N_grid, d_features)
         # target_states: (ar_steps, N_grid, d_features)
@@ -495,6 +1057,44 @@ class WeatherDataset(torch.utils.data.Dataset):
 
         return init_states, target_states, forcing, target_times
 
+    def sample_chunk_ids(self):
+        """
+        Return, for each sample, the index of the chunk that the first state
+        time step of the sample is stored in, along the first (time or
+        analysis time) dimension of the state data. Samples with the same
+        chunk index read (mostly) the same chunks from storage, see
+        `ChunkAwareSampler`.
+
+        The chunks are the ones the data is stored in (see
+        `BaseDatastore.get_time_chunk_sizes`) rather than the dask chunks,
+        since these set which chunks are read for a sample. If the stored
+        chunks aren't known, or the samples are read from the cache (see
+        `cache_dir`), all samples are in chunk 0.
+
+        Returns
+        -------
+        np.ndarray
+            The chunk index of each sample, with shape (len(self),).
+        """
+        chunk_sizes = None
+        if not self._cache_headers:
+            chunk_sizes = self.datastore.get_time_chunk_sizes(
+                category="state", split=self.split
+            )
+        if chunk_sizes is None:
+            return np.zeros(len(self), dtype=np.int64)
+
+        first_state_idx = np.arange(len(self))
+        if not self.datastore.is_forecast:
+            # for analysis data the state of a sample starts after the
+            # offset for the past forcing, for forecast data `idx` is the
+            # analysis time which the chunks are along
+            first_state_idx += self._state_time_range(
+                idx=0, n_steps=self.ar_steps
+            )[0]
+        chunk_ends = np.cumsum(chunk_sizes)
+        return np.searchsorted(chunk_ends, first_state_idx, side="right")
+
     def __iter__(self):
         """
         Convenience method to iterate over the dataset.
@@ -600,8 +1200,61 @@ class WeatherDataset(torch.utils.data.Dataset):
         return da
 
 
+class ChunkAwareSampler(torch.utils.data.Sampler):
+    """
+    Sampler that orders the samples so that samples reading the same chunks
+    of the underlying store follow each other, and thus mostly end up in the
+    same batches. This means that each batch reads few chunks and that
+    chunks are read while still in the cache, rather than every batch
+    reading a chunk for each of its samples.
+
+    When shuffling, the order of the chunks and the order of the samples
+    within each chunk are shuffled every epoch, rather than the order of all
+    samples.
+
+    Parameters
+    ----------
+    chunk_ids : np.ndarray
+        The chunk index of each sample, see
+        `WeatherDataset.sample_chunk_ids`.
+    shuffle : bool, optional
+        Whether to shuffle the chunks and the samples within each chunk.
+        Default is True.
+    """
+
+    def __init__(self, chunk_ids, shuffle=True):
+        self.chunk_ids = np.asarray(chunk_ids)
+        self.shuffle = shuffle
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    def __iter__(self):
+        chunks = np.unique(self.chunk_ids)
+        if self.shuffle:
+            # seed from torch's global RNG, like torch's RandomSampler, so
+            # that the order follows the seed set for training
+            seed = int(torch.empty((), dtype=torch.int64).random_().item())
+            rng = np.random.default_rng(seed)
+            chunks = rng.permutation(chunks)
+        for chunk in chunks:
+            (indices,) = np.nonzero(self.chunk_ids == chunk)
+            if self.shuffle:
+                indices = rng.permutation(indices)
+            yield from indices.tolist()
+
+
 class WeatherDataModule(pl.LightningDataModule):
-    """DataModule for weather data."""
+    """DataModule for weather data.
+
+    Note that the datasets (and so the batches yielded by the dataloaders) of
+    the data module are not standardized. With `standardize=True` the
+    batches are standardized in `on_after_batch_transfer`, once they have
+    been transferred to the device, which Lightning calls when training with
+    a `Trainer`. When the dataloaders are used directly
+    `on_after_batch_transfer` has to be called on each batch to standardize
+    it.
+    """
 
     def __init__(
         self,
@@ -613,6 +1266,9 @@ class WeatherDataModule(pl.LightningDataModule):
         num_future_forcing_steps=1,
         batch_size=4,
         num_workers=16,
+        prefetch_factor=4,
+        cache_dir=None,
+        chunk_aware_sampling=False,
     ):
         super().__init__()
         self._datastore = datastore
@@ -623,6 +1279,13 @@ class WeatherDataModule(pl.LightningDataModule):
         self.standardize = standardize
         self.batch_size = batch_size
         self.num_workers = num_workers
+        self.prefetch_factor = prefetch_factor
+        self.cache_dir = cache_dir
+        self.chunk_aware_sampling = chunk_aware_sampling
+        # standardization statistics (per device) used for standardizing
+        # batches on the device they have been transferred to
+        self._standardization_stats = None
+        self._standardization_stats_on_device = {}
         self.train_dataset = None
         self.val_dataset = None
         self.test_dataset = None
@@ -634,43 +1297,181 @@ class WeatherDataModule(pl.LightningDataModule):
             self.multiprocessing_context = None
 
     def setup(self, stage=None):
+        # The datasets of the splits all share the datastore of the data
+        # module, and are only created once even if `setup` is called for
+        # several stages (e.g. testing after fitting)
         if stage == "fit" or stage is None:
-            self.train_dataset = WeatherDataset(
-                datastore=self._datastore,
-                split="train",
-                ar_steps=self.ar_steps_train,
-                standardize=self.standardize,
-                num_past_forcing_steps=self.num_past_forcing_steps,
-                num_future_forcing_steps=self.num_future_forcing_steps,
+            if self.train_dataset is None:
+                self.train_dataset = self._create_dataset(
+                    split="train", ar_steps=self.ar_steps_train
+                )
+        if stage in ("fit", "validate") or stage is None:
+            if self.val_dataset is None:
+                self.val_dataset = self._create_dataset(
+                    split="val", ar_steps=self.ar_steps_eval
+                )
+        if stage == "test" or stage is None:
+            if self.test_dataset is None:
+                self.test_dataset = self._create_dataset(
+                    split="test", ar_steps=self.ar_steps_eval
+                )
+
+    def _create_dataset(self, split, ar_steps):
+        """
+        Create the (unstandardized, see `on_after_batch_transfer`) dataset
+        for `split` from the datastore of the data module.
+
+        Parameters
+        ----------
+        split : str
+            The data split ("train", "val" or "test").
+        ar_steps : int
+            The number of autoregressive steps of the samples.
+
+        Returns
+        -------
+        WeatherDataset
+            The dataset of the split.
+        """
+        return WeatherDataset(
+            datastore=self._datastore,
+            split=split,
+            ar_steps=ar_steps,
+            standardize=False,
+            num_past_forcing_steps=self.num_past_forcing_steps,
+            num_future_forcing_steps=self.num_future_forcing_steps,
+            cache_dir=self.cache_dir,
+        )
+
+    def _get_standardization_stats(self, device):
+        """
+        Return the statistics for standardizing the state and forcing of a
+        batch as tensors on `device`, see `WeatherDataset._stats_to_tensors`.
+        The statistics are loaded from the datastore on first use.
+
+        Parameters
+        ----------
+        device : torch.device
+            The device to return the statistics on.
+
+        Returns
+        -------
+        dict
+            The mean and reciprocal standard deviation for `state` and (if
+            the datastore has forcing data) `forcing`.
+        """
+        if self._standardization_stats is None:
+            ds_state_stats = self._datastore.get_standardization_dataarray(
+                category="state"
             )
-            self.val_dataset = WeatherDataset(
-                datastore=self._datastore,
-                split="val",
-                ar_steps=self.ar_steps_eval,
-                standardize=self.standardize,
-                num_past_forcing_steps=self.num_past_forcing_steps,
-                num_future_forcing_steps=self.num_future_forcing_steps,
+            stats = dict(
+                state=WeatherDataset._stats_to_tensors(
+                    ds_state_stats.state_mean,
+                    ds_state_stats.state_std,
+                    category="state",
+                )
             )
+            if self._datastore.get_num_data_vars(category="forcing") > 0:
+                ds_forcing_stats = (
+                    self._datastore.get_standardization_dataarray(
+                        category="forcing"
+                    )
+                )
+                stats["forcing"] = WeatherDataset._stats_to_tensors(
+                    ds_forcing_stats.forcing_mean,
+                    ds_forcing_stats.forcing_std,
+                    category="forcing",
+                    window_size=self.num_past_forcing_steps
+                    + self.num_future_forcing_steps
+                    + 1,
+                )
+            self._standardization_stats = stats
 
-        if stage == "test" or stage is None:
-            self.test_dataset = WeatherDataset(
-                datastore=self._datastore,
-                split="test",
-                ar_steps=self.ar_steps_eval,
-                standardize=self.standardize,
-                num_past_forcing_steps=self.num_past_forcing_steps,
-                num_future_forcing_steps=self.num_future_forcing_steps,
+        if device not in self._standardization_stats_on_device:
+            self._standardization_stats_on_device[device] = {
+                category: tuple(
+                    stat.to(device=device, dtype=torch.float32)
+                    for stat in stats
+                )
+                for category, stats in self._standardization_stats.items()
+            }
+        return self._standardization_stats_on_device[device]
+
+    def on_after_batch_transfer(self, batch, dataloader_idx):
+        """
+        Standardize the state and forcing of a batch once it has been
+        transferred to the device, rather than in the dataloader workers.
+
+        Parameters
+        ----------
+        batch : tuple
+            The batch of initial states, target states, forcing and target
+            times, as returned by `WeatherDataset.__getitem__` but collated.
+        dataloader_idx : int
+            The index of the dataloader the batch is from.
+
+        Returns
+        -------
+        tuple
+            The batch with standardized states and forcing.
+        """
+        if not self.standardize:
+            return batch
+
+        init_states, target_states, forcing, target_times = batch
+        stats = self._get_standardization_stats(device=init_states.device)
+
+        # The mean is subtracted before scaling rather than using the fused
+        # affine form `x * std_inv + (-mean * std_inv)`: in float32 the
+        # latter loses the precision of fields whose mean is large relative
+        # to their standard deviation (e.g. temperature in Kelvin), while the
+        # subtraction of close values is exact
+        state_mean, state_std_inv = stats["state"]
+        init_states = init_states.sub_(state_mean).mul_(state_std_inv)
+        target_states = target_states.sub_(state_mean).mul_(state_std_inv)
+        if "forcing" in stats:
+            forcing_mean, forcing_std_inv = stats["forcing"]
+            forcing = forcing.sub_(forcing_mean).mul_(forcing_std_inv)
+
+        return init_states, target_states, forcing, target_times
+
+    def _dataloader_kwargs(self):
+        """
+        Keyword arguments shared by all the dataloaders. Batches are put in
+        pinned memory when training on GPU so that they can be copied to the
+        device asynchronously, and when using worker processes these are
+        kept alive between epochs and each prefetch several batches.
+        """
+        kwargs = dict(
+            num_workers=self.num_workers,
+            pin_memory=torch.cuda.is_available(),
+        )
+        if self.num_workers > 0:
+            kwargs.update(
+                multiprocessing_context=self.multiprocessing_context,
+                persistent_workers=True,
+                prefetch_factor=self.prefetch_factor,
             )
+        return kwargs
 
     def train_dataloader(self):
         """Load train dataset."""
+        if self.chunk_aware_sampling:
+            # shuffle by chunk of the underlying store, see
+            # `ChunkAwareSampler`
+            sampling_kwargs = dict(
+                sampler=ChunkAwareSampler(
+                    chunk_ids=self.train_dataset.sample_chunk_ids(),
+                    shuffle=True,
+                )
+            )
+        else:
+            sampling_kwargs = dict(shuffle=True)
         return torch.utils.data.DataLoader(
             self.train_dataset,
             batch_size=self.batch_size,
-            num_workers=self.num_workers,
-            shuffle=True,
-            multiprocessing_context=self.multiprocessing_context,
-            persistent_workers=True,
+            **sampling_kwargs,
+            **self._dataloader_kwargs(),
         )
 
     def val_dataloader(self):
@@ -678,10 +1479,8 @@ class WeatherDataModule(pl.LightningDataModule):
         return torch.utils.data.DataLoader(
             self.val_dataset,
             batch_size=self.batch_size,
-            num_workers=self.num_workers,
             shuffle=False,
-            multiprocessing_context=self.multiprocessing_context,
-            persistent_workers=True,
+            **self._dataloader_kwargs(),
         )
 
     def test_dataloader(self):
@@ -689,8 +1488,6 @@ class WeatherDataModule(pl.LightningDataModule):
         return torch.utils.data.DataLoader(
             self.test_dataset,
             batch_size=self.batch_size,
-            num_workers=self.num_workers,
             shuffle=False,
-            multiprocessing_context=self.multiprocessing_context,
-            persistent_workers=True,
+            **self._dataloader_kwargs(),
         )
@@ -1,10 +1,13 @@
 # Standard library
+import pickle
+import shutil
 from pathlib import Path
 
 # Third-party
 import numpy as np
 import pytest
 import torch
+import yaml
 from torch.utils.data import DataLoader
 
 # First-party
@@ -12,9 +15,14 @@ from neural_lam import config as nlconfig
 from neural_lam.create_graph import create_graph_from_datastore
 from neural_lam.datastore import DATASTORES
 from neural_lam.datastore.base import BaseRegularGridDatastore
+from neural_lam.datastore.mdp import MDPDatastore
 from neural_lam.models.graph_lam import GraphLAM
-from neural_lam.weather_dataset import WeatherDataset
-from tests.conftest import init_datastore_example
+from neural_lam.weather_dataset import (
+    ChunkAwareSampler,
+    WeatherDataModule,
+    WeatherDataset,
+)
+from tests.conftest import DATASTORES_EXAMPLES, init_datastore_example
 from tests.dummy_datastore import DummyDatastore
 
 
@@ -156,6 +164,57 @@ def test_dataset_item_create_dataarray_from_tensor(datastore_name):
         )
 
 
+@pytest.mark.parametrize("standardize", [False, True])
+@pytest.mark.parametrize(
+    "num_past_forcing_steps,num_future_forcing_steps",
+    [(0, 0), (1, 1), (2, 0), (3, 2), (0, 3)],
+)
+@pytest.mark.parametrize("datastore_name", DATASTORES.keys())
+def test_dataset_item_matches_dataarrays(
+    datastore_name,
+    num_past_forcing_steps,
+    num_future_forcing_steps,
+    standardize,
+):
+    """Check that the samples returned by `WeatherDataset.__getitem__`, which
+    indexes the underlying data by position, match the samples created with
+    xarray by the reference implementation `_build_item_dataarrays`.
+    """
+    datastore = init_datastore_example(datastore_name)
+    dataset = WeatherDataset(
+        datastore=datastore,
+        split="train",
+        ar_steps=3,
+        num_past_forcing_steps=num_past_forcing_steps,
+        num_future_forcing_steps=num_future_forcing_steps,
+        standardize=standardize,
+    )
+
+    for idx in [0, len(dataset) // 2, len(dataset) - 1]:
+        init_states, target_states, forcing, target_times = dataset[idx]
+        (
+            da_init_states,
+            da_target_states,
+            da_forcing_windowed,
+            da_target_times,
+        ) = dataset._build_item_dataarrays(idx=idx)
+
+        # conversion to torch.float32 may lead to loss of precision
+        for tensor, da in [
+            (init_states, da_init_states),
+            (target_states, da_target_states),
+            (forcing, da_forcing_windowed),
+        ]:
+            assert tensor.shape == da.shape
+            np.testing.assert_allclose(
+                tensor.numpy(), da.values, rtol=1e-5, atol=1e-5
+            )
+        np.testing.assert_equal(
+            np.array(target_times, dtype="datetime64[ns]"),
+            da_target_times.values,
+        )
+
+
 @pytest.mark.parametrize("split", ["train", "val", "test"])
 @pytest.mark.parametrize("datastore_name", DATASTORES.keys())
 def test_single_batch(datastore_name, split):
@@ -222,6 +281,40 @@ def test_single_batch(datastore_name, split):
     model_device.training_step(batch_device)
 
 
+@pytest.mark.parametrize("datastore_name", DATASTORES.keys())
+def test_datamodule_standardize_on_batch_transfer(datastore_name):
+    """Check that batches from the (unstandardized) dataloaders of the data
+    module, once standardized in `on_after_batch_transfer`, match the stacked
+    samples of a standardized dataset.
+    """
+    datastore = init_datastore_example(datastore_name)
+
+    batch_size = 2
+    data_module = WeatherDataModule(
+        datastore=datastore,
+        ar_steps_train=2,
+        ar_steps_eval=2,
+        standardize=True,
+        batch_size=batch_size,
+        num_workers=0,
+    )
+    data_module.setup(stage="fit")
+    # the validation samples aren't shuffled
+    batch = next(iter(data_module.val_dataloader()))
+    batch = data_module.on_after_batch_transfer(batch, dataloader_idx=0)
+
+    dataset = WeatherDataset(
+        datastore=datastore, split="val", ar_steps=2, standardize=True
+    )
+    samples = [dataset[idx] for idx in range(batch_size)]
+    for part, expected_parts in zip(batch, zip(*samples)):
+        expected = torch.stack(expected_parts)
+        if expected.is_floating_point():
+            assert torch.allclose(part, expected, atol=1e-5)
+        else:
+            assert torch.equal(part, expected)
+
+
 @pytest.mark.parametrize(
     "dataset_config",
     [
@@ -259,3 +352,110 @@ def test_dataset_length(dataset_config):
     # Check that we can actually get last and first sample
     dataset[0]
     dataset[expected_len - 1]
+
+
+def test_dataset_cache(tmp_path):
+    """Check that samples read from the memory-mapped cache of the data match
+    the samples read from the datastore, also after pickling the dataset (as
+    is done when sending it to DataLoader workers), and that datastores with
+    data of the same shape and times don't share cache files.
+    """
+    for _ in range(2):
+        # each dummy datastore has different (random) data
+        datastore = DummyDatastore(n_timesteps=10)
+
+        dataset = WeatherDataset(datastore=datastore, split="train", ar_steps=2)
+        dataset_cached = WeatherDataset(
+            datastore=datastore, split="train", ar_steps=2, cache_dir=tmp_path
+        )
+        for path in dataset_cached._cache_paths.values():
+            assert path.parent == tmp_path and path.exists()
+
+        dataset_cached = pickle.loads(pickle.dumps(dataset_cached))
+
+        for idx in [0, len(dataset) - 1]:
+            for part, part_cached in zip(dataset[idx], dataset_cached[idx]):
+                # the cache holds the data as float32
+                assert torch.allclose(part, part_cached, atol=1e-6)
+
+    assert len(list(tmp_path.glob("train_state_*.f32"))) == 2
+
+    # regenerate the data of the last datastore, the cache of the old data
+    # must not be used
+    datastore.ds["state"] = datastore.ds["state"] + 1.0
+    dataset = WeatherDataset(datastore=datastore, split="train", ar_steps=2)
+    dataset_cached = WeatherDataset(
+        datastore=datastore, split="train", ar_steps=2, cache_dir=tmp_path
+    )
+    for part, part_cached in zip(dataset[0], dataset_cached[0]):
+        assert torch.allclose(part, part_cached, atol=1e-6)
+
+
+def test_mdp_tensorstore_backend(tmp_path):
+    """Check that samples read from an mdp datastore with the "tensorstore"
+    zarr backend match the samples read with the default backend.
+    """
+    pytest.importorskip("tensorstore")
+    datastore = init_datastore_example("mdp")
+
+    # create a copy of the example mdp datastore using the tensorstore
+    # backend, the zarr archive is copied after writing the config so that
+    # the archive is reused rather than created again
+    config_path_example = Path(DATASTORES_EXAMPLES["mdp"])
+    with open(config_path_example) as fh:
+        config = yaml.safe_load(fh)
+    config.setdefault("extra", {})["zarr_backend"] = "tensorstore"
+    config_path = tmp_path / config_path_example.name
+    with open(config_path, "w") as fh:
+        yaml.dump(config, fh)
+    shutil.copytree(
+        config_path_example.with_suffix(".zarr"),
+        config_path.with_suffix(".zarr"),
+    )
+    datastore_ts = MDPDatastore(config_path=config_path)
+
+    dataset_kwargs = dict(split="train", ar_steps=2, standardize=True)
+    dataset = WeatherDataset(datastore=datastore, **dataset_kwargs)
+    dataset_ts = WeatherDataset(datastore=datastore_ts, **dataset_kwargs)
+    for idx in [0, len(dataset) - 1]:
+        for part, part_ts in zip(dataset[idx], dataset_ts[idx]):
+            assert torch.equal(part, part_ts)
+
+
+@pytest.mark.parametrize("shuffle", [True, False])
+def test_chunk_aware_sampler(tmp_path, shuffle):
+    """Check that the samples are grouped by the chunks the state data is
+    stored in in a zarr archive, and that the chunk-aware sampler returns
+    every sample once, with the samples of each chunk following each other.
+    """
+    # create a copy of the example mdp datastore with the data stored in
+    # chunks of several time steps
+    chunk_size = 7
+    with open(DATASTORES_EXAMPLES["mdp"]) as fh:
+        config = yaml.safe_load(fh)
+    config["output"]["chunking"]["time"] = chunk_size
+    config_path = tmp_path / "danra.datastore.yaml"
+    with open(config_path, "w") as fh:
+        yaml.dump(config, fh)
+    datastore = MDPDatastore(config_path=config_path)
+
+    # with 3 past forcing steps the state of sample `idx` starts at time
+    # step `idx + 1` of the split
+    dataset = WeatherDataset(
+        datastore=datastore,
+        split="train",
+        ar_steps=2,
+        num_past_forcing_steps=3,
+    )
+    chunk_ids = dataset.sample_chunk_ids()
+    assert chunk_ids.tolist() == [
+        (idx + 1) // chunk_size for idx in range(len(dataset))
+    ]
+
+    indices = list(ChunkAwareSampler(chunk_ids=chunk_ids, shuffle=shuffle))
+    assert sorted(indices) == list(range(len(dataset)))
+    if not shuffle:
+        assert indices == list(range(len(dataset)))
+    # the chunk index only changes between chunks
+    n_chunk_changes = np.count_nonzero(np.diff(chunk_ids[indices]))
+    assert n_chunk_changes == len(np.unique(chunk_ids)) - 1
@@ -144,3 +144,32 @@ def test_time_slicing_analysis(
         1 + num_past_forcing_steps + num_future_forcing_steps,
     )
     np.testing.assert_equal(forcing[:, 0, :], np.array(expected_forcing_values))
+
+
+def test_time_slicing_analysis_cached(tmp_path):
+    """Check that the samples of a datastore without a root path can be read
+    from the memory-mapped cache of the data.
+    """
+    time_values = np.datetime64("2020-01-01") + np.arange(
+        len(ANALYSIS_STATE_VALUES)
+    )
+    datastore = SinglePointDummyDatastore(
+        state_data=ANALYSIS_STATE_VALUES,
+        forcing_data=FORCING_VALUES,
+        time_values=time_values,
+        is_forecast=False,
+    )
+
+    dataset_kwargs = dict(
+        datastore=datastore,
+        ar_steps=3,
+        num_past_forcing_steps=1,
+        num_future_forcing_steps=1,
+        standardize=False,
+    )
+    dataset = WeatherDataset(**dataset_kwargs)
+    dataset_cached = WeatherDataset(cache_dir=tmp_path, **dataset_kwargs)
+
+    for idx in [0, len(dataset) - 1]:
+        for part, part_cached in zip(dataset[idx], dataset_cached[idx]):
+            np.testing.assert_array_equal(part.numpy(), part_cached.numpy())